@@ -6,31 +6,78 @@
 #
 
 from dynamixel_sdk import *                    # Uses Dynamixel SDK library
-from time import sleep
+from time import sleep, perf_counter
+from itertools import product
+from math import ceil, exp, sqrt
+import weakref
+try:
+    import numpy as np                         # Only needed for StateEstimator
+except ImportError:
+    np = None
 
 class AX_12A:
 
-    instances = []
+    # Motors declared without a group keyword go in this group.
+    defaultGroup = 'default'
 
-    def __init__(self, id = 1, baudRate = 1000000, devicePort='/dev/ttyUSB0', printInfo=True):
+    def __init__(self, id = 1, baudRate = 1000000, devicePort='/dev/ttyUSB0', printInfo=True, name=None, group=None, useCodec=False):
         """
         Inputs: None
         Returns: None
         Purpose: Set up variables to match technical specifications
         """
         self.id                     = id
+        # Optional name for looking the motor up in its group, e.g. 'shoulder'.
+        self.name                   = name
         self.baudRate               = baudRate
         # Default devicePort assumes Linux and first USB port. Windows:"COM*" Mac:"/dev/tty.usbserial-*"
         self.devicePort             = devicePort
         self.printInfo              = printInfo
         self.connected              = False
+        # If True, connect() sets up the built-in Protocol1Codec instead of the SDK PacketHandler
+        # for reading and writing.  The SDK is still used to open the port.
+        self.useCodec               = useCodec
+        self.codec                  = None
+        # Status Return Level of the Dynamixel, so the codec knows which instructions get a
+        # reply.  Kept up to date by setStatusReturnLevel(), set it by hand before connect()
+        # if the motor is already set to something other than the default 2.
+        self.statusReturnLevel      = 2
         # These will agree with values stored in Dynamixel memory typically
         # Except in Wheel Mode, when they will store prior value for returning to Joint Mode.
         self.cwAngleLimit           = None
         self.ccwAngleLimit          = None
-
-        # Keep a list of all instances of this class for making poses
-        self.__class__.instances.append(self)
+        # True between wheelMode() and jointMode().  Can't be told from the attributes above,
+        # since wheelMode() keeps the joint mode limits in them.  Checked at connect().
+        self.inWheelMode            = False
+        # Buffered mode: RAM setters only mark registers dirty in a shadow of the control
+        # table, nothing is sent until flush() (or AX_12A.flushAll()) is called.
+        self.buffered               = False
+        self.__dirty                = {}    # memAddr: (numBytes, value) waiting to be flushed
+        self.__written              = {}    # memAddr: value last written to the Dynamixel
+        # Last values set with setGoalPosition() and setMovingSpeed() (buffered or not).
+        self.lastGoalPosition       = None
+        self.lastMovingSpeed        = None
+        self.lastTorqueLimit        = None
+        # Fastest Moving Speed the motor can really reach, used by moveTo().  The AX-12A does
+        # about 59 rpm at 12 V with no load, which is 531 at 0.111 rpm per unit.  Lower it for
+        # lower voltage or heavy loads.
+        self.maxMovingSpeed         = 531
+        # Moving Speed and Torque Limit are multiplied by these before writing.
+        # Normally 1.0, ThermalGovernor turns them down to keep the motor from overheating.
+        self.speedScale             = 1.0
+        self.torqueScale            = 1.0
+        # Error bits from every status packet received, OR'ed together until cleared.
+        self.errorFlags             = 0
+        # StateEstimator()s following this motor, told about every Goal Position and Moving
+        # Speed that actually reaches the Dynamixel (buffered values only once flushed).
+        self.estimators             = weakref.WeakSet()
+
+        # Add to a MotorGroup (by name or MotorGroup instance) for making poses.
+        # The group only keeps a weak reference, so discarded motors drop out.
+        self.group                  = None
+        if group is None:
+            group = self.__class__.defaultGroup
+        MotorGroup.getGroup(group).add(self)
 
         # Control table addresses. Look up in eManual, I am using decimal not hex.
         ### EEPROM: If writing to EEPROM, put in a 250 ms delay or you risk memory corruption.
@@ -73,6 +120,20 @@ class AX_12A:
         self.ADDR_PUNCH                 = 48    # Size 2 bytes  Default Value 32
         ### End of RAM area
         self.PROTOCOL_VERSION           = 1.0
+        # Units: Moving Speed is 0.111 rpm per unit, Position is 300 degrees over 0-1023.
+        self.SPEED_UNIT_RPM             = 0.111
+        self.POSITION_UNIT_DEG          = 300 / 1023
+        # Error bits in the status packet
+        self.ERROR_INPUT_VOLTAGE        = 1
+        self.ERROR_ANGLE_LIMIT          = 2
+        self.ERROR_OVERHEATING          = 4
+        self.ERROR_RANGE                = 8
+        self.ERROR_CHECKSUM             = 16
+        self.ERROR_OVERLOAD             = 32
+        self.ERROR_INSTRUCTION          = 64
+        # Bits that only report the state of the motor, a write answered with just these
+        # still took effect.  The others mean the instruction was rejected.
+        self.ERROR_ALARMS               = self.ERROR_INPUT_VOLTAGE | self.ERROR_OVERHEATING | self.ERROR_OVERLOAD
 
     def __dxlSetter(self, numBytes, memAddr, valueToSet):
         if self.connected:
@@ -85,19 +146,120 @@ class AX_12A:
             else:
                 if self.printInfo: print ("[INTERNAL ERROR] numBytes invalid in ax-12a method __dxlSetter().")
                 return 3
-            dxlCommResult, dxlError = thisSetter(self.portHandler, self.id, memAddr, valueToSet)
+            # In buffered mode, RAM writes wait in the shadow until flush().
+            # EEPROM writes always go straight out, they need their 250 ms delay anyway.
+            if self.buffered and memAddr >= self.ADDR_TORQUE_ENABLE:
+                return self.__bufferWrite(numBytes, memAddr, valueToSet)
+            if self.codec is not None:
+                dxlCommResult, dxlError = self.codec.write(self.id, memAddr, numBytes, valueToSet)
+            else:
+                dxlCommResult, dxlError = thisSetter(self.portHandler, self.id, memAddr, valueToSet)
             if dxlCommResult != COMM_SUCCESS:
                 if self.printInfo: print("%s" % self.packetHandler.getTxRxResult(dxlCommResult))
                 return 1
             elif dxlError != 0:
+                self.errorFlags |= dxlError
                 if self.printInfo: print("%s" % self.packetHandler.getRxPacketError(dxlError))
+                if not dxlError & ~self.ERROR_ALARMS: self.__wrote(memAddr, valueToSet)
                 return 2
+            else:
+                self.__wrote(memAddr, valueToSet)
+                return 0
+        else:
+            if self.printInfo: print("[ERROR] ID:", self.id, "Motor not connected. Run .connect() method.")
+            return 3
+
+    def __dxlBlockSetter(self, memAddr, data):
+        # Writes a list of bytes starting at memAddr in a single packet.
+        if self.connected:
+            if self.codec is not None:
+                dxlCommResult, dxlError = self.codec.writeBlock(self.id, memAddr, data)
+            else:
+                dxlCommResult, dxlError = self.packetHandler.writeTxRx(self.portHandler, self.id, memAddr, len(data), data)
+            if dxlCommResult != COMM_SUCCESS:
+                if self.printInfo: print("%s" % self.packetHandler.getTxRxResult(dxlCommResult))
+                return 1
+            elif dxlError & ~self.ERROR_ALARMS:
+                self.errorFlags |= dxlError
+                if self.printInfo: print("%s" % self.packetHandler.getRxPacketError(dxlError))
+                return 2
+            else:
+                # Only alarm bits (or none): the write took effect, the alarm is kept in errorFlags.
+                if dxlError != 0:
+                    self.errorFlags |= dxlError
+                    if self.printInfo: print("%s" % self.packetHandler.getRxPacketError(dxlError))
+                return 0
+        else:
+            if self.printInfo: print("[ERROR] ID:", self.id, "Motor not connected. Run .connect() method.")
+            return 3
+
+    def __dxlSyncWrite(self, memAddr, length, params):
+        # Writes the same registers on several motors in one broadcast packet.
+        # params is a list of (id, list of bytes).  Sync write gets no status packet,
+        # so only communication errors can be detected.
+        if self.connected:
+            if self.codec is not None:
+                dxlCommResult = self.codec.syncWrite(memAddr, length, params)
+            else:
+                groupSyncWrite = GroupSyncWrite(self.portHandler, self.packetHandler, memAddr, length)
+                for dxlId, data in params:
+                    groupSyncWrite.addParam(dxlId, data)
+                dxlCommResult = groupSyncWrite.txPacket()
+            if dxlCommResult != COMM_SUCCESS:
+                if self.printInfo: print("%s" % self.packetHandler.getTxRxResult(dxlCommResult))
+                return 1
             else:
                 return 0
         else:
             if self.printInfo: print("[ERROR] ID:", self.id, "Motor not connected. Run .connect() method.")
             return 3
 
+    def __bufferWrite(self, numBytes, memAddr, valueToSet):
+        # Repeated sets just overwrite the shadow, and a value that is already
+        # on the Dynamixel cancels any change still waiting for flush().
+        if self.__written.get(memAddr) == valueToSet:
+            self.__dirty.pop(memAddr, None)
+        else:
+            self.__dirty[memAddr] = (numBytes, valueToSet)
+        return 0
+
+    def __wasWritten(self, setterError, memAddr, valueToSet):
+        # True if a setter's value reached the Dynamixel (or the buffer), including writes that
+        # came back with only alarm bits set (error code 2, see ERROR_ALARMS).
+        return setterError == 0 or (setterError == 2 and self.__written.get(memAddr) == valueToSet)
+
+    def __writeLabel(self):
+        # RAM setters print [BUFFER] in buffered mode, the value is only sent by flush().
+        return "[BUFFER]" if self.buffered else "[WRITE]"
+
+    def __dirtyRuns(self):
+        # Merges dirty registers at adjacent addresses into runs, so that e.g. Goal Position,
+        # Moving Speed and Torque Limit (30-35) go out as one 6-byte write.
+        # Returns a list of [startAddr, list of bytes, list of memAddr in the run].
+        runs = []
+        for memAddr in sorted(self.__dirty):
+            numBytes, value = self.__dirty[memAddr]
+            data = [(value >> (8 * i)) & 0xFF for i in range(numBytes)]
+            if runs and runs[-1][0] + len(runs[-1][1]) == memAddr:
+                runs[-1][1].extend(data)
+                runs[-1][2].append(memAddr)
+            else:
+                runs.append([memAddr, data, [memAddr]])
+        return runs
+
+    def __commitRun(self, run):
+        # Moves the registers of a successfully written run from dirty to written.
+        for memAddr in run[2]:
+            self.__wrote(memAddr, self.__dirty.pop(memAddr)[1])
+
+    def __wrote(self, memAddr, value):
+        # Records a value that is now on the Dynamixel, and passes commands on to estimators.
+        self.__written[memAddr] = value
+        self.__dirty.pop(memAddr, None)
+        if memAddr == self.ADDR_GOAL_POSITION or memAddr == self.ADDR_MOVING_SPEED:
+            for estimator in self.estimators:
+                estimator.commandWritten(self, memAddr, value)
+
     def __dxlGetter(self, numBytes, memAddr):
         if self.connected:
             if numBytes == 1:
@@ -109,11 +271,15 @@ class AX_12A:
             else:
                 if self.printInfo: print ("[INTERNAL ERROR] numBytes invalid in ax-12a method __dxlGetter().")
                 return None, 3
-            getResult, dxlCommResult, dxlError = thisGetter(self.portHandler, self.id, memAddr)
+            if self.codec is not None:
+                getResult, dxlCommResult, dxlError = self.codec.read(self.id, memAddr, numBytes)
+            else:
+                getResult, dxlCommResult, dxlError = thisGetter(self.portHandler, self.id, memAddr)
             if dxlCommResult != COMM_SUCCESS:
                 if self.printInfo: print("%s" % self.packetHandler.getTxRxResult(dxlCommResult))
                 return None, 1
             elif dxlError != 0:
+                self.errorFlags |= dxlError
                 if self.printInfo: print("%s" % self.packetHandler.getRxPacketError(dxlError))
                 return None, 2
             else:
@@ -122,6 +288,27 @@ class AX_12A:
             if self.printInfo: print("[ERROR] ID:", self.id, "Motor not connected. Run .connect() method.")
             return 3
 
+    def __dxlBlockGetter(self, memAddr, length):
+        # Reads length bytes starting at memAddr in a single packet, returns a list of bytes.
+        if self.connected:
+            if self.codec is not None:
+                data, dxlCommResult, dxlError = self.codec.readBlock(self.id, memAddr, length)
+            else:
+                data, dxlCommResult, dxlError = self.packetHandler.readTxRx(self.portHandler, self.id, memAddr, length)
+            if dxlCommResult != COMM_SUCCESS:
+                if self.printInfo: print("%s" % self.packetHandler.getTxRxResult(dxlCommResult))
+                return None, 1
+            elif dxlError != 0:
+                # The data is still good, pass it on for reading e.g. temperature during an alarm.
+                self.errorFlags |= dxlError
+                if self.printInfo: print("%s" % self.packetHandler.getRxPacketError(dxlError))
+                return data, 2
+            else:
+                return data, 0
+        else:
+            if self.printInfo: print("[ERROR] ID:", self.id, "Motor not connected. Run .connect() method.")
+            return None, 3
+
 
 ################################################################################
 ##########                        EEPROM Area                         ##########
@@ -258,11 +445,13 @@ class AX_12A:
         # Both will have been set to zero, save the values that were there.
         self.cwAngleLimit = tmpCwAngleLimit
         self.ccwAngleLimit = tmpCcwAngleLimit
+        self.inWheelMode = True
         if localPrintInfo:
             print("[INFO] ID:", self.id, "set to wheel mode.")
             self.printInfo = True
 
     def jointMode(self):
+        self.inWheelMode = False
         # Check if stored values make sense.  If so, use them.
         if self.cwAngleLimit >= 0 and self.cwAngleLimit < 1023:
             if self.ccwAngleLimit > 0 and self.ccwAngleLimit <=1023:
@@ -355,6 +544,8 @@ class AX_12A:
         statusReturnLevelError = self.__dxlSetter(1, self.ADDR_STATUS_RETURN_LEVEL, statusReturnLevelValue)
         if statusReturnLevelError == 0:
             if self.printInfo: print("[WRITE] ID:", self.id, "Status Return Level set to", statusReturnLevelValue)
+            self.statusReturnLevel = statusReturnLevelValue
+            if self.codec is not None: self.codec.statusReturnLevel = statusReturnLevelValue
             sleep(0.25)
             return None
         else:
@@ -409,7 +600,7 @@ class AX_12A:
     def setTorqueEnable(self, torqueEnableValue):
         torqueEnableError = self.__dxlSetter(1, self.ADDR_TORQUE_ENABLE, torqueEnableValue)
         if torqueEnableError == 0:
-            if self.printInfo: print("[WRITE] ID:", self.id, "Torque Enable set to", torqueEnableValue)
+            if self.printInfo: print(self.__writeLabel(), "ID:", self.id, "Torque Enable set to", torqueEnableValue)
             return None
         else:
             return torqueEnableError
@@ -431,7 +622,7 @@ class AX_12A:
     def setLED(self, ledValueValue):
         ledValueError = self.__dxlSetter(1, self.ADDR_LED, ledValueValue)
         if ledValueError == 0:
-            if self.printInfo: print("[WRITE] ID:", self.id, "LED set to", ledValueValue)
+            if self.printInfo: print(self.__writeLabel(), "ID:", self.id, "LED set to", ledValueValue)
             return None
         else:
             return ledValueError
@@ -447,7 +638,7 @@ class AX_12A:
     def setCwComplianceMargin(self, cwComplianceMarginValue):
         cwComplianceMarginError = self.__dxlSetter(1, self.ADDR_CW_COMPLIANCE_MARGIN, cwComplianceMarginValue)
         if cwComplianceMarginError == 0:
-            if self.printInfo: print("[WRITE] ID:", self.id, "CW Compliance Margin set to", cwComplianceMarginValue)
+            if self.printInfo: print(self.__writeLabel(), "ID:", self.id, "CW Compliance Margin set to", cwComplianceMarginValue)
             return None
         else:
             return cwComplianceMarginError
@@ -463,7 +654,7 @@ class AX_12A:
     def setCcwComplianceMargin(self, ccwComplianceMarginValue):
         ccwComplianceMarginError = self.__dxlSetter(1, self.ADDR_CCW_COMPLIANCE_MARGIN, ccwComplianceMarginValue)
         if ccwComplianceMarginError == 0:
-            if self.printInfo: print("[WRITE] ID:", self.id, "CCW Compliance Margin set to", ccwComplianceMarginValue)
+            if self.printInfo: print(self.__writeLabel(), "ID:", self.id, "CCW Compliance Margin set to", ccwComplianceMarginValue)
             return None
         else:
             return ccwComplianceMarginError
@@ -479,7 +670,7 @@ class AX_12A:
     def setCwComplianceSlope(self, cwComplianceSlopeValue):
         cwComplianceSlopeError = self.__dxlSetter(1, self.ADDR_CW_COMPLIANCE_SLOPE, cwComplianceSlopeValue)
         if cwComplianceSlopeError == 0:
-            if self.printInfo: print("[WRITE] ID:", self.id, "CW Compliance Slope set to", cwComplianceSlopeValue)
+            if self.printInfo: print(self.__writeLabel(), "ID:", self.id, "CW Compliance Slope set to", cwComplianceSlopeValue)
             return None
         else:
             return cwComplianceSlopeError
@@ -495,7 +686,7 @@ class AX_12A:
     def setCcwComplianceSlope(self, ccwComplianceSlopeValue):
         ccwComplianceSlopeError = self.__dxlSetter(1, self.ADDR_CCW_COMPLIANCE_SLOPE, ccwComplianceSlopeValue)
         if ccwComplianceSlopeError == 0:
-            if self.printInfo: print("[WRITE] ID:", self.id, "CCW Compliance Slope set to", ccwComplianceSlopeValue)
+            if self.printInfo: print(self.__writeLabel(), "ID:", self.id, "CCW Compliance Slope set to", ccwComplianceSlopeValue)
             return None
         else:
             return ccwComplianceSlopeError
@@ -512,8 +703,10 @@ class AX_12A:
         # New goal position has to be between the angle limits.
         if goalPositionValue <= self.ccwAngleLimit and goalPositionValue >= self.cwAngleLimit:
             goalPositionError = self.__dxlSetter(2, self.ADDR_GOAL_POSITION, goalPositionValue)
+            if self.__wasWritten(goalPositionError, self.ADDR_GOAL_POSITION, goalPositionValue):
+                self.lastGoalPosition = goalPositionValue
             if goalPositionError == 0:
-                if self.printInfo: print("[WRITE] ID:", self.id, "Goal Position set to", goalPositionValue)
+                if self.printInfo: print(self.__writeLabel(), "ID:", self.id, "Goal Position set to", goalPositionValue)
                 return None
             else:
                 return goalPositionError
@@ -533,6 +726,10 @@ class AX_12A:
             adjMovingSpeed = None
             if self.printInfo:
                 print("[ERROR] ID:", self.id, "getMovingSpeed found value out of range:", movingSpeed)
+        # Undo speedScale, so what was passed to setMovingSpeed() comes back.
+        if adjMovingSpeed and self.speedScale != 1 and self.speedScale > 0:
+            unscaledSpeed = min(1023, int(round(abs(adjMovingSpeed) / self.speedScale)))
+            adjMovingSpeed = unscaledSpeed if adjMovingSpeed > 0 else -unscaledSpeed
         if movingSpeedError == 0:
             if self.printInfo: print("[READ] ID:", self.id, "Goal Moving Speed:", adjMovingSpeed)
             return adjMovingSpeed
@@ -557,13 +754,24 @@ class AX_12A:
             errorString = "[Error] ID: " + str(self.id) + " setMovingSpeed should be between -1023 and 1023, received: " + str(movingSpeed)
             if self.printInfo: print(errorString)
             return errorString
-        if movingSpeed < 0: # CW movement in wheel mode
-            adjMovingSpeed = 1024 + -movingSpeed
+        # Scale down if speedScale is below 1 (see ThermalGovernor), but never all the way to 0.
+        # In joint mode 0 means full speed, so that is scaled as 1023.
+        scaledSpeed = movingSpeed
+        if self.speedScale != 1:
+            if movingSpeed != 0:
+                scaledSpeed = max(1, int(round(abs(movingSpeed) * self.speedScale)))
+                if movingSpeed < 0: scaledSpeed = -scaledSpeed
+            elif not self.inWheelMode:
+                scaledSpeed = max(1, int(round(1023 * self.speedScale)))
+        if scaledSpeed < 0: # CW movement in wheel mode
+            adjMovingSpeed = 1024 + -scaledSpeed
         else:
-            adjMovingSpeed = movingSpeed
+            adjMovingSpeed = scaledSpeed
         movingSpeedError = self.__dxlSetter(2, self.ADDR_MOVING_SPEED, adjMovingSpeed)
+        if self.__wasWritten(movingSpeedError, self.ADDR_MOVING_SPEED, adjMovingSpeed):
+            self.lastMovingSpeed = movingSpeed
         if movingSpeedError == 0:
-            if self.printInfo: print("[WRITE] ID:", self.id, "Goal Moving Speed set to", movingSpeed)
+            if self.printInfo: print(self.__writeLabel(), "ID:", self.id, "Goal Moving Speed set to", movingSpeed)
             return None
         else:
             return movingSpeedError
@@ -571,15 +779,22 @@ class AX_12A:
     def getTorqueLimit(self):
         torqueLimit, torqueLimitError = self.__dxlGetter(2, self.ADDR_TORQUE_LIMIT)
         if torqueLimitError == 0:
+            # Undo torqueScale, so what was passed to setTorqueLimit() comes back.
+            if self.torqueScale != 1 and self.torqueScale > 0:
+                torqueLimit = min(1023, int(round(torqueLimit / self.torqueScale)))
             if self.printInfo: print("[READ] ID:", self.id, "Torque Limit:", torqueLimit)
             return torqueLimit
         else:
             return None
 
     def setTorqueLimit(self, torqueLimitValue):
-        torqueLimitError = self.__dxlSetter(2, self.ADDR_TORQUE_LIMIT, torqueLimitValue)
+        # Scaled down if torqueScale is below 1 (see ThermalGovernor).
+        scaledTorqueLimit = int(round(torqueLimitValue * self.torqueScale))
+        torqueLimitError = self.__dxlSetter(2, self.ADDR_TORQUE_LIMIT, scaledTorqueLimit)
+        if self.__wasWritten(torqueLimitError, self.ADDR_TORQUE_LIMIT, scaledTorqueLimit):
+            self.lastTorqueLimit = torqueLimitValue
         if torqueLimitError == 0:
-            if self.printInfo: print("[WRITE] ID:", self.id, "Torque Limit set to", torqueLimitValue)
+            if self.printInfo: print(self.__writeLabel(), "ID:", self.id, "Torque Limit set to", torqueLimitValue)
             return None
         else:
             return torqueLimitError
@@ -604,6 +819,20 @@ class AX_12A:
         else:
             return None
 
+    def getPresentState(self):
+        # Reads Present Position and Present Speed (addresses 36-39) in one round trip.
+        # Speed is adjusted for the 11th bit, as in getPresentSpeed().
+        presentState, presentStateError = self.__dxlBlockGetter(self.ADDR_PRESENT_POSITION, 4)
+        if presentStateError == 0:
+            presentPosition = presentState[0] | (presentState[1] << 8)
+            presentSpeed = presentState[2] | (presentState[3] << 8)
+            if presentSpeed > 1023:
+                presentSpeed = -(presentSpeed - 1024)
+            if self.printInfo: print("[READ] ID:", self.id, "Present Position:", presentPosition, "Present Speed:", presentSpeed)
+            return presentPosition, presentSpeed
+        else:
+            return None, None
+
     def getPresentLoad(self):
         presentLoad, presentLoadError = self.__dxlGetter(2, self.ADDR_PRESENT_LOAD)
         if presentLoadError == 0:
@@ -630,6 +859,20 @@ class AX_12A:
         else:
             return None
 
+    def getTelemetry(self):
+        # Reads Present Load, Present Voltage and Present Temperature (addresses 40-43) in one
+        # round trip.  Load is adjusted for the 11th bit, as in getPresentLoad().  The values are
+        # returned even if the status packet has error bits set (they are added to errorFlags).
+        telemetry, telemetryError = self.__dxlBlockGetter(self.ADDR_PRESENT_LOAD, 4)
+        if telemetryError in (0, 2):
+            presentLoad = telemetry[0] | (telemetry[1] << 8)
+            if presentLoad > 1023:
+                presentLoad = -(presentLoad - 1024)
+            if self.printInfo: print("[READ] ID:", self.id, "Present Load:", presentLoad, "Present Voltage:", telemetry[2], "Present Temperature:", telemetry[3])
+            return presentLoad, telemetry[2], telemetry[3]
+        else:
+            return None, None, None
+
     def getRegistered(self):
         registered, registeredError = self.__dxlGetter(1, self.ADDR_REGISTERED)
         if registeredError == 0:
@@ -663,7 +906,7 @@ class AX_12A:
         # until powered down and restarted.
         lockError = self.__dxlSetter(1, self.ADDR_LOCK, lockValue)
         if lockError == 0:
-            if self.printInfo: print("[WRITE] ID:", self.id, "Lock set to", lockValue)
+            if self.printInfo: print(self.__writeLabel(), "ID:", self.id, "Lock set to", lockValue)
             return None
         else:
             return lockError
@@ -679,15 +922,83 @@ class AX_12A:
     def setPunch(self, punchValue):
         punchError = self.__dxlSetter(2, self.ADDR_PUNCH, punchValue)
         if punchError == 0:
-            if self.printInfo: print("[WRITE] ID:", self.id, "Punch set to", punchValue)
+            if self.printInfo: print(self.__writeLabel(), "ID:", self.id, "Punch set to", punchValue)
             return None
         else:
             return punchError
 
+################################################################################
+##########                       Buffered Writes                      ##########
+################################################################################
+
+    def setBuffered(self, bufferedValue):
+        """
+        Inputs: True or False
+        Returns: None if successful, otherwise the error from flushing pending writes.
+        Purpose: Turn buffered mode on or off.  In buffered mode, the RAM setters only record
+            the new value; call flush() (or AX_12A.flushAll()) once per control tick to send them.
+            Turning buffered mode off flushes anything still pending.
+        """
+        self.buffered = bufferedValue
+        if self.printInfo: print("[INFO] ID:", self.id, "Buffered mode set to", bufferedValue)
+        if not bufferedValue:
+            return self.flush()
+        return None
+
+    def flush(self):
+        """
+        Inputs: None
+        Returns: None if successful, otherwise an error code.
+        Purpose: Send the buffered register changes for this motor only, one write per run of
+            adjacent registers.  Use AX_12A.flushAll() to combine writes across motors.
+        """
+        flushError = None
+        for run in self.__dirtyRuns():
+            runError = self.__dxlBlockSetter(run[0], run[1])
+            if runError == 0:
+                self.__commitRun(run)
+                if self.printInfo: print("[WRITE] ID:", self.id, "flushed", len(run[1]), "bytes at address", run[0])
+            else:
+                flushError = runError
+        return flushError
+
+    def clearShadow(self):
+        """
+        Inputs: None
+        Returns: None
+        Purpose: Forget the values last written to the Dynamixel, so the next buffered write of
+            every register is sent even if it looks unchanged.  Needed if the Dynamixel changed its
+            own RAM, e.g. torque turned off by an alarm shutdown.
+        """
+        self.__written = {}
+
+    def getWrittenValue(self, memAddr):
+        """
+        Inputs: A control table address.
+        Returns: The raw register value last written there by this instance (after flush() in
+            buffered mode), or None if nothing was written since connecting or clearShadow().
+        """
+        return self.__written.get(memAddr)
+
+    def setCodec(self, useCodecValue):
+        """
+        Inputs: True or False
+        Returns: None
+        Purpose: Switch between the built-in Protocol1Codec and the SDK PacketHandler for all
+            reads and writes.  Takes effect immediately if connected, otherwise at connect().
+        """
+        self.useCodec = useCodecValue
+        if self.connected:
+            self.codec = Protocol1Codec(self.portHandler, self.statusReturnLevel) if useCodecValue else None
+        if self.printInfo: print("[INFO] ID:", self.id, "Built-in codec set to", useCodecValue)
+
     def connect(self):
         if not self.connected:
             # Set connected to True, reset back to False if an error occurs.
             self.connected = True
+            # Buffered mode would only record the test write below, so it is off during connect().
+            localBuffered = self.buffered
+            self.buffered = False
 
             # Initialize PortHandler instance, Set the port path
             # Get methods and members of PortHandlerLinux or PortHandlerWindows
@@ -713,6 +1024,9 @@ class AX_12A:
                 self.connected = False
                 quit()
 
+            if self.useCodec:
+                self.codec = Protocol1Codec(self.portHandler, self.statusReturnLevel)
+
             # Attempt to write
             torqueEnableError = self.enableTorque()
             if torqueEnableError:
@@ -730,6 +1044,7 @@ class AX_12A:
                 else:
                     if self.printInfo: print("[ERROR] ID:", self.id, "Read attempt failed in AX-12A connect() method.")
                     self.connected = False
+                    self.buffered = localBuffered
                     return
 
             # If both Angle Limits are zero, we're in wheel mode, otherwise, in joint mode.
@@ -738,6 +1053,7 @@ class AX_12A:
             if self.connected:
                 self.cwAngleLimit = self.getCwAngleLimit()
                 self.ccwAngleLimit = self.getCcwAngleLimit()
+                self.inWheelMode = self.cwAngleLimit == 0 and self.ccwAngleLimit == 0
                 if self.cwAngleLimit != 0 or self.ccwAngleLimit != 0:
                     if self.cwAngleLimit > presentPosition:
                         if self.printInfo: print("[INFO] ID:", self.id, "Motor out of range. Move motor to minimum position.")
@@ -745,81 +1061,361 @@ class AX_12A:
                     elif self.ccwAngleLimit < self.getPresentPosition():
                         if self.printInfo: print("[INFO] ID:", self.id, "Motor out of range. Move motor to maximum position.")
                         self.setGoalPosition(self.ccwAngleLimit)
+            self.buffered = localBuffered
         else:
             if self.printInfo: print("[INFO] ID:", self.id, "connect() called when motor already connected.")
             return
 
     @classmethod
     def listInstances(cls):
-        return(cls.instances)
+        """
+        Returns the motors in the default group (all motors declared without a group keyword),
+        in the order they were declared.  See MotorGroup for robots with their own groups.
+        """
+        return MotorGroup.getGroup(cls.defaultGroup).listMotors()
 
     @classmethod
     def connectAll(cls):
-        motors = AX_12A.listInstances()
-        for motor in motors:
-            motor.connect()
+        return MotorGroup.getGroup(cls.defaultGroup).connectAll()
 
     @classmethod
     def getAll(cls, method):
         """
-        Runs the same .get...() method on all connected motors.
+        Runs the same .get...() method on all motors in the default group.
         Returns a list of all the values captured.
         """
-        method = 'motor.' + method + '()'
-        motors = AX_12A.listInstances()
-        gets = []
-        for motor in motors:
-            gets.append(eval(method))
-        return gets
+        return MotorGroup.getGroup(cls.defaultGroup).getAll(method)
 
     @classmethod
     def setAll(cls, method, value):
         """
-        Runs the same .set...(value) method on all connected motors.
+        Runs the same .set...(value) method on all motors in the default group.
         Returns a list of all the values captured (will be 'None' for every motor
             that executes without errors).
         """
-        method = 'motor.' + method + '(' + str(value) + ')'
-        motors = AX_12A.listInstances()
-        setErrorResults = []
+        return MotorGroup.getGroup(cls.defaultGroup).setAll(method, value)
+
+    @classmethod
+    def flushAll(cls, motors=None):
+        """
+        Inputs: Optional list of AX_12A() instances, defaults to the default group.
+        Returns: A list with one entry per motor: None if its writes went out, otherwise an error code.
+        Purpose: Send the buffered register changes of all motors.  Adjacent registers on one motor
+            are merged into one write, and when several motors on the same port change the same
+            registers, they are all sent in one sync write packet.
+        """
+        if motors is None:
+            motors = AX_12A.listInstances()
+        flushErrors = {}
+        # Key: (devicePort, startAddr, length), value: list of (motor, run)
+        packets = {}
         for motor in motors:
-            setErrorResults.append(eval(method))
-        return setErrorResults
+            flushErrors[motor] = None
+            if motor.connected:
+                for run in motor.__dirtyRuns():
+                    packets.setdefault((motor.devicePort, run[0], len(run[1])), []).append((motor, run))
+        for (devicePort, memAddr, length), entries in packets.items():
+            if len(entries) == 1:
+                motor, run = entries[0]
+                runError = motor.__dxlBlockSetter(memAddr, run[1])
+            else:
+                params = [(motor.id, run[1]) for motor, run in entries]
+                runError = entries[0][0].__dxlSyncWrite(memAddr, length, params)
+            for motor, run in entries:
+                if runError == 0:
+                    motor.__commitRun(run)
+                    if motor.printInfo: print("[WRITE] ID:", motor.id, "flushed", length, "bytes at address", memAddr)
+                else:
+                    flushErrors[motor] = runError
+        return [flushErrors[motor] for motor in motors]
 
     @classmethod
     def setPose(cls, positions):
         """
-        Inputs: List of integers, each a goal position of an AX_12A() instance.
+        Same as MotorGroup.setPose(), for the default group.
+        """
+        return MotorGroup.getGroup(cls.defaultGroup).setPose(positions)
+
+    @classmethod
+    def moveTo(cls, positions, maxSpeed=None):
+        """
+        Same as MotorGroup.moveTo(), for the default group.
+        """
+        return MotorGroup.getGroup(cls.defaultGroup).moveTo(positions, maxSpeed)
+
+    @classmethod
+    def readPose(cls):
+        return MotorGroup.getGroup(cls.defaultGroup).readPose()
+
+    @classmethod
+    def waitForMotors(cls):
+        return MotorGroup.getGroup(cls.defaultGroup).waitForMotors()
+
+
+################# MotorGroup Class #####################
+#
+
+class MotorGroup:
+
+    # All groups by name, so the same group can be found from anywhere.
+    groups = {}
+
+    def __init__(self, name):
+        """
+        Inputs: name, any hashable value, usually a string like 'leftArm'.
+        Returns: None
+        Purpose: A named set of AX_12A() motors, e.g. one robot.  Motors can be looked up by ID or
+            by name, and are only weakly referenced, so a motor that is no longer used anywhere
+            else drops out of its group by itself.
+        """
+        if name in self.__class__.groups:
+            raise ValueError("A group named " + repr(name) + " already exists, use MotorGroup.getGroup() to get it")
+        self.name                   = name
+        # Controls messages from the group itself, motors use their own printInfo.
+        self.printInfo              = True
+        self.__byId                 = weakref.WeakValueDictionary()
+        self.__byName               = weakref.WeakValueDictionary()
+        # IDs in the order they were added, used as the order of a pose.  A dict is used as an
+        # ordered set.  An ID keeps its place even if its motor is discarded, so that poses do
+        # not shift; a new motor with the same ID takes the old place.
+        self.__order                = {}
+        self.__class__.groups[name] = self
+
+    @classmethod
+    def getGroup(cls, name):
+        """
+        Inputs: A group name (or a MotorGroup, which is returned as is).
+        Returns: The MotorGroup with that name, created if it does not exist yet.
+        """
+        if isinstance(name, MotorGroup):
+            return name
+        if name not in cls.groups:
+            MotorGroup(name)
+        return cls.groups[name]
+
+    @classmethod
+    def removeGroup(cls, name):
+        """
+        Removes a group from the list of groups, its motors are no longer in any group.
+        """
+        group = cls.groups.pop(name, None)
+        if group is not None:
+            for motor in group.listMotors():
+                motor.group = None
+
+    def add(self, motor):
+        """
+        Inputs: An AX_12A() instance.
+        Returns: None
+        Purpose: Add a motor to this group, taking it out of the group it was in.  If a different
+            motor with the same ID is already in this group, the new motor replaces it.
+        """
+        if motor.group is not None and motor.group is not self:
+            motor.group.remove(motor)
+        oldMotor = self.__byId.get(motor.id)
+        if oldMotor is not None and oldMotor is not motor:
+            if motor.printInfo: print("[INFO] ID:", motor.id, "replaces the motor with the same ID in group", self.name)
+            # Not remove(), the new motor keeps the old one's place in the pose order.
+            if oldMotor.name is not None and self.__byName.get(oldMotor.name) is oldMotor:
+                del self.__byName[oldMotor.name]
+            oldMotor.group = None
+        self.__byId[motor.id] = motor
+        self.__order.setdefault(motor.id)
+        if motor.name is not None:
+            self.__byName[motor.name] = motor
+        motor.group = self
+
+    def remove(self, motor):
+        """
+        Inputs: An AX_12A() instance, or the ID or name of a motor in this group.
+        Returns: None
+        Purpose: Take a motor out of this group.  Its place in the pose order is removed as well,
+            so the positions of the motors after it move up by one.
+        """
+        if not isinstance(motor, AX_12A):
+            motor = self.getById(motor) or self.getByName(motor)
+            if motor is None:
+                return
+        if self.__byId.get(motor.id) is motor:
+            del self.__byId[motor.id]
+            self.__order.pop(motor.id, None)
+        if motor.name is not None and self.__byName.get(motor.name) is motor:
+            del self.__byName[motor.name]
+        if motor.group is self:
+            motor.group = None
+
+    def getById(self, id):
+        return self.__byId.get(id)
+
+    def getByName(self, name):
+        return self.__byName.get(name)
+
+    def listMotors(self):
+        """
+        Returns the motors still in use, in pose order.
+        """
+        motors = []
+        for id in self.__order:
+            motor = self.__byId.get(id)
+            if motor is not None:
+                motors.append(motor)
+        return motors
+
+    def __len__(self):
+        return len(self.__byId)
+
+    def __iter__(self):
+        return iter(self.listMotors())
+
+    def __contains__(self, motor):
+        return self.__byId.get(motor.id) is motor
+
+    def __poseMotors(self, positions):
+        # Pairs up a pose with the motors it is for.  A list or tuple is in pose order,
+        # a dict is keyed by ID or by name.  Entries that are None are skipped.
+        # Returns a list of (motor, position).
+        pairs = []
+        if isinstance(positions, dict):
+            items = positions.items()
+        else:
+            items = zip(self.__order, positions)
+        for key, position in items:
+            if position is None:
+                continue
+            motor = self.__byId.get(key)
+            if motor is None:
+                motor = self.__byName.get(key)
+            if motor is None:
+                if self.printInfo: print("[ERROR] Group:", self.name, "has no motor", key, "for position", position)
+            else:
+                pairs.append((motor, position))
+        return pairs
+
+    def connectAll(self):
+        for motor in self.listMotors():
+            motor.connect()
+
+    def getAll(self, method):
+        """
+        Runs the same .get...() method on all motors in the group.
+        Returns a list of all the values captured.
+        """
+        gets = []
+        for motor in self.listMotors():
+            gets.append(getattr(motor, method)())
+        return gets
+
+    def setAll(self, method, value):
+        """
+        Runs the same .set...(value) method on all motors in the group.
+        Returns a list of all the values captured (will be 'None' for every motor
+            that executes without errors).
+        """
+        setErrorResults = []
+        for motor in self.listMotors():
+            setErrorResults.append(getattr(motor, method)(value))
+        return setErrorResults
+
+    def flushAll(self):
+        return AX_12A.flushAll(self.listMotors())
+
+    def setPose(self, positions):
+        """
+        Inputs: Either a list of integers, each a goal position of a motor in this group, in the
+                order the motors were added, or a dict of goal positions keyed by motor ID or name.
             You can avoid setting a value for one or more motors by putting 'None'
                 at each location in the list that you want to skip.
-            Assumes that AX_12A() has a list of instances which can be retrieved via AX_12A.listInstances()
         Returns: None
-        Purpose: Given a list of length n, will set the first n AX-12A motors, in order, to those positions.
+        Purpose: Given a list of length n, will set the first n motors of the group, in order, to those positions.
             You do not need to use all motors, but you do need to give values all of the first n motors.
         """
-        motors = AX_12A.listInstances()
-        for index, position in enumerate(positions):
-            if position != None:
-                motors[index].setGoalPosition(position)
+        for motor, position in self.__poseMotors(positions):
+            motor.setGoalPosition(position)
         return
 
-    @classmethod
-    def readPose(cls):
-        motors = AX_12A.listInstances()
+    def moveTo(self, positions, maxSpeed=None):
+        """
+        Inputs: positions: A pose, as for setPose().
+            maxSpeed: The fastest Moving Speed allowed, either one value for all motors or a
+                dict keyed by motor ID or name.  It is never more than each motor's
+                maxMovingSpeed, which is also the default.
+        Returns: The predicted time, in seconds, until all the motors arrive, or None if a
+            goal is outside its motor's angle limits or a present position could not be read
+            (nothing is moved then), or if a write failed.
+        Purpose: Move to a pose so that all motors arrive at the same time, as soon as possible.
+            The motor with the longest move (relative to its maxSpeed) goes at maxSpeed, the others
+            are slowed down to match.  Speeds and goals are written together, in one sync write
+            if the motors share a port.
+        """
+        # The AX-12A has no bulk read instruction, so this is one pass over the motors
+        # before anything is written.
+        moves = []
+        for motor, position in self.__poseMotors(positions):
+            # setGoalPosition() would refuse it, the others would then time their moves for nothing.
+            if motor.cwAngleLimit is None or not motor.cwAngleLimit <= position <= motor.ccwAngleLimit:
+                if motor.printInfo: print("[ERROR] ID:", motor.id, "moveTo() goal", position, "is outside the angle limits.")
+                return None
+            presentPosition = motor.getPresentPosition()
+            if presentPosition is None:
+                if motor.printInfo: print("[ERROR] ID:", motor.id, "moveTo() could not read Present Position.")
+                return None
+            if isinstance(maxSpeed, dict):
+                motorMaxSpeed = maxSpeed.get(motor.id, maxSpeed.get(motor.name, motor.maxMovingSpeed))
+            elif maxSpeed is None:
+                motorMaxSpeed = motor.maxMovingSpeed
+            else:
+                motorMaxSpeed = maxSpeed
+            # Faster than the motor can go, it would arrive late and the others early.
+            motorMaxSpeed = min(motorMaxSpeed, motor.maxMovingSpeed)
+            # Position units per second for each unit of Moving Speed
+            unitRate = motor.SPEED_UNIT_RPM * 360 / 60 / motor.POSITION_UNIT_DEG
+            # What the motor will really be limited to after setMovingSpeed() scales it.
+            motorMaxSpeed = max(1, int(motorMaxSpeed * motor.speedScale))
+            moves.append((motor, position, abs(position - presentPosition), motorMaxSpeed, unitRate))
+        arrivalTime = 0.0
+        for motor, position, distance, motorMaxSpeed, unitRate in moves:
+            arrivalTime = max(arrivalTime, distance / (motorMaxSpeed * unitRate))
+        localBuffered = []
+        for motor, position, distance, motorMaxSpeed, unitRate in moves:
+            localBuffered.append(motor.buffered)
+            motor.buffered = True
+            # Round up so no motor arrives late.  Never 0, in joint mode that means no speed control.
+            if arrivalTime > 0:
+                movingSpeed = min(motorMaxSpeed, max(1, ceil(distance / (arrivalTime * unitRate))))
+            else:
+                movingSpeed = motorMaxSpeed
+            # Undo the scaling setMovingSpeed() will apply, so movingSpeed is what gets written.
+            if motor.speedScale != 1: movingSpeed = movingSpeed / motor.speedScale
+            motor.setMovingSpeed(movingSpeed)
+            motor.setGoalPosition(position)
+        motors = [move[0] for move in moves]
+        flushErrors = AX_12A.flushAll(motors)
+        for motor, buffered in zip(motors, localBuffered):
+            motor.buffered = buffered
+        if any(flushErrors):
+            return None
+        return arrivalTime
+
+    def readPose(self):
+        """
+        Returns the present positions of the motors in the group, in pose order.
+        Motors that are not connected or no longer exist are None, so positions never shift.
+        """
         motorPositions = []
-        for motor in motors:
-            if motor.connected:
-                pos = motor.getPresentPosition()
-                motorPositions.append(pos)
+        for id in self.__order:
+            motor = self.__byId.get(id)
+            if motor is not None and motor.connected:
+                motorPositions.append(motor.getPresentPosition())
+            else:
+                motorPositions.append(None)
         return motorPositions
 
-    @classmethod
-    def waitForMotors(cls):
+    def waitForMotors(self):
         # The localPrintInfo list stores the current state of self.printInfo for each motor.
         # This allows for temporarily silencing the output while checking for moving status.
         # All self.printInfo values are re-set to their prior values at the end.
         localPrintInfo = []
-        motors = AX_12A.listInstances()
+        motors = self.listMotors()
         for motor in motors:
             localPrintInfo.append(motor.printInfo)
             motor.printInfo = False
@@ -831,8 +1427,801 @@ class AX_12A:
         printInfoAny = False
         for index, motor in enumerate(motors):
             motor.printInfo = localPrintInfo[index]
-            if localPrintInfo:
+            if localPrintInfo[index]:
                 printInfoAny = True
         if printInfoAny:
-            print("[INFO] All motors have stopped moving.")
+            print("[INFO] All motors in group", self.name, "have stopped moving.")
         return
+
+
+################# ComplianceTuner Class #####################
+#
+
+class ComplianceTuner:
+
+    def __init__(self, motors, stepPositions=(412, 612), margins=(0, 1, 2), slopes=(16, 32, 64),
+            punches=(32,), torqueLimits=(1023,), settleBand=3, holdTime=0.1, timeout=3.0, repeats=2,
+            printInfo=True):
+        """
+        Inputs:
+            motors: An AX_12A() instance, a MotorGroup, or the name of a group.
+            stepPositions: The two goal positions the motors step back and forth between.
+            margins, slopes, punches, torqueLimits: The values to try for each register.
+                Margins and slopes are set the same for CW and CCW.
+            settleBand: How close (in position units) a motor has to stay to its goal to be settled.
+            holdTime: How long (in seconds) it has to stay there.
+            timeout: Longest time (in seconds) to wait for one step.
+            repeats: How many times to step both ways for each setting.
+        Returns: None
+        Purpose: Find the compliance, punch and torque limit settings that get the motors to their
+            goal fastest, by timing real step moves instead of tuning by eye.
+        """
+        if isinstance(motors, AX_12A):
+            self.motors             = [motors]
+        else:
+            self.motors             = MotorGroup.getGroup(motors).listMotors()
+        if not self.motors:
+            raise ValueError("ComplianceTuner needs at least one motor, group " + str(motors) + " is empty.")
+        # setGoalPosition() refuses goals outside the angle limits, the steps would never start.
+        for motor in self.motors:
+            if not motor.connected or motor.cwAngleLimit is None:
+                raise ValueError("ID: " + str(motor.id) + " is not connected, connect() it before tuning.")
+            if motor.inWheelMode:
+                raise ValueError("ID: " + str(motor.id) + " is in wheel mode, step moves need joint mode.")
+            for position in stepPositions:
+                if not motor.cwAngleLimit <= position <= motor.ccwAngleLimit:
+                    raise ValueError("Step position " + str(position) + " is outside the angle limits of ID: "
+                        + str(motor.id) + " (" + str(motor.cwAngleLimit) + " to " + str(motor.ccwAngleLimit) + ").")
+        self.stepPositions          = stepPositions
+        self.margins                = margins
+        self.slopes                 = slopes
+        self.punches                = punches
+        self.torqueLimits           = torqueLimits
+        self.settleBand             = settleBand
+        self.holdTime               = holdTime
+        self.timeout                = timeout
+        self.repeats                = repeats
+        self.printInfo              = printInfo
+        # One entry per setting tried, filled in by tune().
+        self.results                = []
+
+    @staticmethod
+    def stepResponse(times, positions, start, target, settleBand):
+        """
+        Inputs: Lists of sample times (seconds since the goal was set) and positions, the start
+            and target positions of the step, and the settle band in position units.
+        Returns: A dict with
+            riseTime: seconds to go from 10% to 90% of the step (None if it never got to 90%),
+            overshoot: farthest position past the target, in position units,
+            settleTime: seconds until it stayed within settleBand of target (None if it never did).
+        """
+        step = target - start
+        if step == 0 or len(positions) == 0:
+            return {'riseTime': 0.0, 'overshoot': 0, 'settleTime': 0.0}
+        direction = 1 if step > 0 else -1
+        t10 = t90 = None
+        overshoot = 0
+        lastOutside = None
+        for index, position in enumerate(positions):
+            progress = (position - start) / step
+            if t10 is None and progress >= 0.1: t10 = times[index]
+            if t90 is None and progress >= 0.9: t90 = times[index]
+            overshoot = max(overshoot, (position - target) * direction)
+            if abs(position - target) > settleBand: lastOutside = index
+        riseTime = t90 - t10 if t90 is not None else None
+        if lastOutside is None:
+            settleTime = 0.0
+        elif lastOutside + 1 < len(positions):
+            settleTime = times[lastOutside + 1]
+        else:
+            settleTime = None
+        return {'riseTime': riseTime, 'overshoot': overshoot, 'settleTime': settleTime}
+
+    def __applySettings(self, settings):
+        for motor in self.motors:
+            motor.setCwComplianceMargin(settings['margin'])
+            motor.setCcwComplianceMargin(settings['margin'])
+            motor.setCwComplianceSlope(settings['slope'])
+            motor.setCcwComplianceSlope(settings['slope'])
+            motor.setPunch(settings['punch'])
+            motor.setTorqueLimit(settings['torqueLimit'])
+        AX_12A.flushAll(self.motors)
+
+    def __setGoals(self, position):
+        for motor in self.motors:
+            motor.setGoalPosition(position)
+        AX_12A.flushAll(self.motors)
+
+    def __waitForMotors(self):
+        # Bounded by timeout, a stalled or overloaded joint may never stop "moving".
+        t0 = perf_counter()
+        moving = True
+        while moving and perf_counter() - t0 < self.timeout:
+            moving = False
+            for motor in self.motors:
+                if motor.getMoving(): moving = True
+
+    def measureStep(self, start, target):
+        """
+        Inputs: Start and target positions.
+        Returns: A list with the stepResponse() dict of each motor.
+        Purpose: Move all motors to start, then set them all to target at once and sample their
+            positions as fast as the bus allows until they have all settled or timeout is up.
+        """
+        self.__setGoals(start)
+        self.__waitForMotors()
+        samples = [([], []) for motor in self.motors]
+        inBandSince = [None] * len(self.motors)
+        self.__setGoals(target)
+        t0 = perf_counter()
+        while True:
+            for index, motor in enumerate(self.motors):
+                position = motor.getPresentPosition()
+                t = perf_counter() - t0
+                if position is None: continue
+                samples[index][0].append(t)
+                samples[index][1].append(position)
+                if abs(position - target) <= self.settleBand:
+                    if inBandSince[index] is None: inBandSince[index] = t
+                else:
+                    inBandSince[index] = None
+            t = perf_counter() - t0
+            if all(since is not None and t - since >= self.holdTime for since in inBandSince): break
+            if t >= self.timeout: break
+        return [self.stepResponse(times, positions, start, target, self.settleBand) for times, positions in samples]
+
+    def tune(self, apply=False):
+        """
+        Inputs: apply: If True, the best setting is left on the motors.  Otherwise the settings
+            the motors had before tuning are put back.
+        Returns: A dict with the best settings and their riseTime, overshoot and settleTime,
+            or None if no setting ever settled.  All results are saved in self.results.
+        Purpose: Try every combination of the margins, slopes, punches and torque limits.  For
+            each, step back and forth between stepPositions and time the moves.  A setting is
+            scored by the average of the slowest motor's settle time, since that sets the cycle time.
+        """
+        # Silence the motors during tuning, there would be a line for every sample.
+        localPrintInfo = [motor.printInfo for motor in self.motors]
+        for motor in self.motors:
+            motor.printInfo = False
+        original = []
+        best = None
+        applied = False
+        # Whatever happens (including Ctrl-C), put back the original settings and printInfo.
+        try:
+            for motor in self.motors:
+                original.append({'cwMargin': motor.getCwComplianceMargin(), 'ccwMargin': motor.getCcwComplianceMargin(),
+                    'cwSlope': motor.getCwComplianceSlope(), 'ccwSlope': motor.getCcwComplianceSlope(),
+                    'punch': motor.getPunch(), 'torqueLimit': motor.getTorqueLimit()})
+            self.results = []
+            a, b = self.stepPositions
+            for margin, slope, punch, torqueLimit in product(self.margins, self.slopes, self.punches, self.torqueLimits):
+                settings = {'margin': margin, 'slope': slope, 'punch': punch, 'torqueLimit': torqueLimit}
+                self.__applySettings(settings)
+                steps = []
+                for repeat in range(self.repeats):
+                    steps.append(self.measureStep(a, b))
+                    steps.append(self.measureStep(b, a))
+                result = dict(settings)
+                settleTimes = [[m['settleTime'] for m in step] for step in steps]
+                if any(None in step for step in settleTimes):
+                    result['settleTime'] = None
+                else:
+                    result['settleTime'] = sum(max(step) for step in settleTimes) / len(steps)
+                riseTimes = [m['riseTime'] for step in steps for m in step if m['riseTime'] is not None]
+                result['riseTime'] = sum(riseTimes) / len(riseTimes) if riseTimes else None
+                result['overshoot'] = max(m['overshoot'] for step in steps for m in step)
+                self.results.append(result)
+                if self.printInfo: print("[TUNE]", settings, "rise:", result['riseTime'], "overshoot:", result['overshoot'], "settle:", result['settleTime'])
+            settled = [result for result in self.results if result['settleTime'] is not None]
+            best = min(settled, key=lambda result: (result['settleTime'], result['overshoot'])) if settled else None
+            if apply and best is not None:
+                self.__applySettings(best)
+                applied = True
+        finally:
+            if not applied:
+                for motor, settings in zip(self.motors, original):
+                    if None in settings.values(): continue
+                    motor.setCwComplianceMargin(settings['cwMargin'])
+                    motor.setCcwComplianceMargin(settings['ccwMargin'])
+                    motor.setCwComplianceSlope(settings['cwSlope'])
+                    motor.setCcwComplianceSlope(settings['ccwSlope'])
+                    motor.setPunch(settings['punch'])
+                    motor.setTorqueLimit(settings['torqueLimit'])
+                AX_12A.flushAll(self.motors)
+            for motor, printInfo in zip(self.motors, localPrintInfo):
+                motor.printInfo = printInfo
+        if self.printInfo:
+            if best is None:
+                print("[TUNE] No setting settled within", self.settleBand, "units in", self.timeout, "seconds.")
+            else:
+                print("[TUNE] Best:", {key: best[key] for key in ('margin', 'slope', 'punch', 'torqueLimit')},
+                    "settle time:", best['settleTime'], "Applied." if apply else "Not applied.")
+        return best
+
+
+################# StateEstimator Class #####################
+#
+
+class StateEstimator:
+
+    def __init__(self, motors, alpha=0.85, beta=0.5, sensorNoise=1.0, processNoise=50.0):
+        """
+        Inputs:
+            motors: An AX_12A() instance, a MotorGroup, or the name of a group.
+            alpha, beta: How much a new reading corrects the predicted position and velocity
+                (0 = ignore readings, 1 = take readings as they are).
+            sensorNoise: Standard deviation of a position reading, in position units.
+            processNoise: How fast (position units per second) the prediction is assumed to drift
+                away from the real position after the last reading.
+        Returns: None
+        Purpose: Answer position and velocity queries for every motor at any time without
+            touching the bus.  Each motor's last reading is moved forward in time towards its
+            last commanded goal at its last commanded speed, and corrected by every new reading
+            with an alpha-beta filter.  Requires NumPy.
+        """
+        if np is None:
+            raise ImportError("StateEstimator requires NumPy.")
+        if isinstance(motors, AX_12A):
+            self.motors             = [motors]
+        else:
+            self.motors             = MotorGroup.getGroup(motors).listMotors()
+        self.alpha                  = alpha
+        self.beta                   = beta
+        self.sensorNoise            = sensorNoise
+        self.processNoise           = processNoise
+        self.__index                = {motor.id: index for index, motor in enumerate(self.motors)}
+        count = len(self.motors)
+        # Filtered state at the time of the last reading of each motor, positions in position
+        # units and velocities in position units per second.  NaN until the first reading.
+        self.__position             = np.full(count, np.nan)
+        self.__velocity             = np.zeros(count)
+        self.__readTime             = np.full(count, np.nan)
+        # Position units per second for each unit of Moving Speed
+        self.__unitRate             = np.array([motor.SPEED_UNIT_RPM * 360 / 60 / motor.POSITION_UNIT_DEG for motor in self.motors])
+        # Next motor to read in update(), so a partial update works round-robin.
+        self.__nextRead             = 0
+        # Goal Position and Moving Speed last written to each motor, kept up to date by the
+        # motors through commandWritten().  NaN goal where none was written yet.
+        self.__goal                 = np.full(count, np.nan)
+        self.__speed                = np.array([motor.maxMovingSpeed for motor in self.motors], dtype=float)
+        # Goal Position is ignored in wheel mode.  Refreshed by update().
+        self.__wheel                = np.array([motor.inWheelMode for motor in self.motors], dtype=bool)
+        for motor in self.motors:
+            motor.estimators.add(self)
+            for memAddr in (motor.ADDR_GOAL_POSITION, motor.ADDR_MOVING_SPEED):
+                value = motor.getWrittenValue(memAddr)
+                if value is not None: self.commandWritten(motor, memAddr, value)
+
+    def commandWritten(self, motor, memAddr, value):
+        """
+        Inputs: A motor, the address written (Goal Position or Moving Speed) and the raw value.
+        Returns: None
+        Purpose: Called by the motors whenever a command reaches the Dynamixel, so predictions
+            only steer towards goals that were really sent.
+        """
+        index = self.__index.get(motor.id)
+        if index is None or self.motors[index] is not motor: return
+        if memAddr == motor.ADDR_GOAL_POSITION:
+            self.__goal[index] = value
+        elif memAddr == motor.ADDR_MOVING_SPEED:
+            # The register already holds any speedScale.  Bit 10 is the wheel mode direction,
+            # 0 is full speed in joint mode, and no motor goes faster than maxMovingSpeed.
+            movingSpeed = value & 1023
+            self.__speed[index] = min(movingSpeed, motor.maxMovingSpeed) if movingSpeed else motor.maxMovingSpeed
+
+    def __predict(self, indices, t):
+        # Moves the filtered state of the motors at indices forward to time t (a scalar or array).
+        # With a goal, the motor moves towards it at its commanded speed and stops there;
+        # otherwise (never set, or in wheel mode) it keeps its last velocity.
+        # Returns predicted positions and velocities.
+        goals = np.where(self.__wheel[indices], np.nan, self.__goal[indices])
+        position = self.__position[indices]
+        velocity = self.__velocity[indices]
+        dt = np.maximum(t - self.__readTime[indices], 0.0)
+        rate = self.__speed[indices] * self.__unitRate[indices]
+        toGo = goals - position
+        travel = np.minimum(np.abs(toGo), rate * dt)
+        direction = np.sign(toGo)
+        hasGoal = ~np.isnan(goals)
+        predictedPosition = np.where(hasGoal, position + direction * travel, position + velocity * dt)
+        predictedVelocity = np.where(hasGoal, np.where(travel < np.abs(toGo), direction * rate, 0.0), velocity)
+        return predictedPosition, predictedVelocity
+
+    def __fuse(self, indices, positions, speeds, times):
+        # Alpha-beta correction of the predicted state with new readings.  Speeds are in
+        # Moving Speed units and converted to position units per second.
+        indices = np.asarray(indices, dtype=int)
+        positions = np.asarray(positions, dtype=float)
+        velocities = np.asarray(speeds, dtype=float) * self.__unitRate[indices]
+        times = np.asarray(times, dtype=float)
+        predictedPosition, predictedVelocity = self.__predict(indices, times)
+        first = np.isnan(self.__readTime[indices])
+        self.__position[indices] = np.where(first, positions, predictedPosition + self.alpha * (positions - predictedPosition))
+        self.__velocity[indices] = np.where(first, velocities, predictedVelocity + self.beta * (velocities - predictedVelocity))
+        self.__readTime[indices] = times
+
+    def observe(self, motor, position, speed, t=None):
+        """
+        Inputs: A motor (or its ID), a Present Position and Present Speed read somewhere else,
+            and the time they were read (perf_counter(), default now).
+        Returns: None
+        Purpose: Feed readings taken by other code into the estimate.
+        """
+        if isinstance(motor, AX_12A): motor = motor.id
+        if t is None: t = perf_counter()
+        self.__fuse([self.__index[motor]], [position], [speed], [t])
+
+    def update(self, count=None):
+        """
+        Inputs: count: How many motors to read this time (default all).  The motors are read
+            round-robin, so a control loop can spend a fixed amount of bus time per tick.
+        Returns: The number of motors read successfully.
+        Purpose: Read Present Position and Present Speed of some motors (one round trip each)
+            and fold them into the estimate.
+        """
+        if count is None or count > len(self.motors): count = len(self.motors)
+        self.__wheel = np.array([motor.inWheelMode for motor in self.motors], dtype=bool)
+        indices, positions, speeds, times = [], [], [], []
+        for k in range(count):
+            index = (self.__nextRead + k) % len(self.motors)
+            motor = self.motors[index]
+            tBefore = perf_counter()
+            presentPosition, presentSpeed = motor.getPresentState()
+            if presentPosition is None: continue
+            indices.append(index)
+            positions.append(presentPosition)
+            speeds.append(presentSpeed)
+            times.append((tBefore + perf_counter()) / 2)
+        if len(self.motors): self.__nextRead = (self.__nextRead + count) % len(self.motors)
+        if indices: self.__fuse(indices, positions, speeds, times)
+        return len(indices)
+
+    def getState(self, t=None):
+        """
+        Inputs: t: The time to estimate for, as perf_counter() (default now).
+        Returns: Four NumPy arrays, in the order of self.motors:
+            position (position units), velocity (position units per second),
+            age (seconds since the last reading, inf if never read),
+            stdDev (estimated standard deviation of the position, in position units).
+            Motors never read have NaN position.
+        """
+        if t is None: t = perf_counter()
+        indices = np.arange(len(self.motors))
+        position, velocity = self.__predict(indices, t)
+        age = np.where(np.isnan(self.__readTime), np.inf, np.maximum(t - self.__readTime, 0.0))
+        stdDev = np.sqrt(self.sensorNoise ** 2 + (self.processNoise * age) ** 2)
+        return position, velocity, age, stdDev
+
+    def getMotorState(self, motor, t=None):
+        """
+        Same as getState() for one motor (or its ID), as a tuple of numbers.
+        """
+        if isinstance(motor, AX_12A): motor = motor.id
+        if t is None: t = perf_counter()
+        index = self.__index[motor]
+        position, velocity = self.__predict(np.array([index]), t)
+        readTime = self.__readTime[index]
+        age = np.inf if np.isnan(readTime) else max(t - readTime, 0.0)
+        stdDev = np.sqrt(self.sensorNoise ** 2 + (self.processNoise * age) ** 2)
+        return float(position[0]), float(velocity[0]), float(age), float(stdDev)
+
+
+################# Protocol1Codec Class #####################
+#
+
+class Protocol1Codec:
+
+    # Protocol 1.0 instructions used by the AX-12A
+    INST_PING                   = 0x01
+    INST_READ                   = 0x02
+    INST_WRITE                  = 0x03
+    INST_REG_WRITE              = 0x04
+    INST_ACTION                 = 0x05
+    INST_SYNC_WRITE             = 0x83
+    BROADCAST_ID                = 0xFE
+    # Longest possible packet: 0xFF 0xFF ID LENGTH, then up to 255 bytes counted by LENGTH.
+    MAX_PACKET_LENGTH           = 259
+
+    def __init__(self, portHandler, statusReturnLevel=2):
+        """
+        Inputs: An open PortHandler from the Dynamixel SDK, and the Status Return Level the
+            motors on it are set to (2: every instruction gets a reply, 1: only read and ping,
+            0: only ping).
+        Returns: None
+        Purpose: A lean packet encoder/decoder for the AX-12A instruction set, used instead of the
+            SDK PacketHandler when AX_12A(useCodec=True).  Packets are cached per (ID, address,
+            width) so a write only fills in the value bytes and finishes a precomputed checksum,
+            and a status packet is read into a preallocated buffer, asking the port for the whole
+            expected length at once.
+        """
+        self.portHandler            = portHandler
+        self.statusReturnLevel      = statusReturnLevel
+        # (inst, id, addr, width): [packet bytearray, checksum of everything but the data bytes]
+        self.__writeTemplates       = {}
+        # (id, addr, width): complete read packet, these never change
+        self.__readPackets          = {}
+        self.__status               = bytearray(self.MAX_PACKET_LENGTH)
+        self.__statusView           = memoryview(self.__status)
+        self.__sync                 = bytearray(self.MAX_PACKET_LENGTH)
+        self.__syncView             = memoryview(self.__sync)
+
+    @staticmethod
+    def makePacket(dxlId, instruction, params):
+        """
+        Returns a complete instruction packet as a bytearray.
+        """
+        length = len(params) + 2
+        packet = bytearray([0xFF, 0xFF, dxlId, length, instruction])
+        packet.extend(params)
+        packet.append(~(dxlId + length + instruction + sum(params)) & 0xFF)
+        return packet
+
+    def __writeTemplate(self, instruction, dxlId, memAddr, width):
+        key = (instruction, dxlId, memAddr, width)
+        template = self.__writeTemplates.get(key)
+        if template is None:
+            packet = self.makePacket(dxlId, instruction, [memAddr] + [0] * width)
+            template = [packet, dxlId + (width + 3) + instruction + memAddr]
+            self.__writeTemplates[key] = template
+        return template
+
+    def __txRx(self, packet, dxlId, expectStatus, paramLength):
+        # Sends a packet and, if expected, reads and checks the status packet.
+        # Returns (memoryview of the status parameters or None, comm result, error byte).
+        port = self.portHandler
+        if port.is_using:
+            return None, COMM_PORT_BUSY, 0
+        port.is_using = True
+        port.clearPort()
+        if port.writePort(packet) != len(packet):
+            port.is_using = False
+            return None, COMM_TX_FAIL, 0
+        if dxlId == self.BROADCAST_ID or not expectStatus:
+            port.is_using = False
+            return None, COMM_SUCCESS, 0
+        status = self.__status
+        statusView = self.__statusView
+        statusLength = paramLength + 6
+        port.setPacketTimeout(statusLength)
+        received = 0
+        while True:
+            if received < statusLength:
+                # Ask for everything still missing at once, usually it has all arrived.
+                chunk = port.readPort(statusLength - received)
+                if chunk:
+                    statusView[received:received + len(chunk)] = chunk
+                    received += len(chunk)
+                elif port.isPacketTimeout():
+                    port.is_using = False
+                    return None, (COMM_RX_TIMEOUT if received == 0 else COMM_RX_CORRUPT), 0
+                continue
+            # Resynchronize on the header if there was noise before the packet.
+            start = status.find(b'\xff\xff', 0, received)
+            if start != 0 or status[2] != dxlId or status[3] != paramLength + 2:
+                if start <= 0: start = 1
+                statusView[0:received - start] = statusView[start:received]
+                received -= start
+                continue
+            port.is_using = False
+            if (~sum(statusView[2:statusLength - 1]) & 0xFF) != status[statusLength - 1]:
+                return None, COMM_RX_CORRUPT, 0
+            return statusView[5:5 + paramLength], COMM_SUCCESS, status[4]
+
+    def ping(self, dxlId):
+        """
+        Returns (comm result, error byte).
+        """
+        packet = self.__readPackets.get((dxlId, None, None))
+        if packet is None:
+            packet = self.__readPackets[(dxlId, None, None)] = bytes(self.makePacket(dxlId, self.INST_PING, []))
+        data, dxlCommResult, dxlError = self.__txRx(packet, dxlId, True, 0)
+        return dxlCommResult, dxlError
+
+    def read(self, dxlId, memAddr, width):
+        """
+        Returns (value, comm result, error byte), the value read as a little-endian integer.
+        """
+        data, dxlCommResult, dxlError = self.readBlock(dxlId, memAddr, width)
+        if data is None:
+            return 0, dxlCommResult, dxlError
+        value = 0
+        for i in range(width):
+            value |= data[i] << (8 * i)
+        return value, dxlCommResult, dxlError
+
+    def readBlock(self, dxlId, memAddr, length):
+        """
+        Returns (list of bytes, comm result, error byte).  With Status Return Level 0 nothing
+        would come back, so nothing is sent and the comm result is COMM_NOT_AVAILABLE.
+        """
+        if self.statusReturnLevel < 1:
+            return None, COMM_NOT_AVAILABLE, 0
+        key = (dxlId, memAddr, length)
+        packet = self.__readPackets.get(key)
+        if packet is None:
+            packet = self.__readPackets[key] = bytes(self.makePacket(dxlId, self.INST_READ, [memAddr, length]))
+        data, dxlCommResult, dxlError = self.__txRx(packet, dxlId, True, length)
+        if data is None:
+            return None, dxlCommResult, dxlError
+        return list(data), dxlCommResult, dxlError
+
+    def write(self, dxlId, memAddr, width, value, instruction=INST_WRITE):
+        """
+        Writes value as a little-endian integer of width bytes.  Returns (comm result, error byte).
+        """
+        packet, checksum = self.__writeTemplate(instruction, dxlId, memAddr, width)
+        for i in range(width):
+            byte = (value >> (8 * i)) & 0xFF
+            packet[6 + i] = byte
+            checksum += byte
+        packet[6 + width] = ~checksum & 0xFF
+        data, dxlCommResult, dxlError = self.__txRx(packet, dxlId, self.statusReturnLevel >= 2, 0)
+        return dxlCommResult, dxlError
+
+    def writeBlock(self, dxlId, memAddr, data, instruction=INST_WRITE):
+        """
+        Writes a list of bytes starting at memAddr.  Returns (comm result, error byte).
+        """
+        width = len(data)
+        packet, checksum = self.__writeTemplate(instruction, dxlId, memAddr, width)
+        packet[6:6 + width] = bytes(data)
+        packet[6 + width] = ~(checksum + sum(data)) & 0xFF
+        result, dxlCommResult, dxlError = self.__txRx(packet, dxlId, self.statusReturnLevel >= 2, 0)
+        return dxlCommResult, dxlError
+
+    def regWrite(self, dxlId, memAddr, data):
+        """
+        Like writeBlock(), but the Dynamixel holds the write until action() is sent.
+        """
+        return self.writeBlock(dxlId, memAddr, data, self.INST_REG_WRITE)
+
+    def action(self, dxlId=BROADCAST_ID):
+        """
+        Carries out the writes held by regWrite().  Returns the comm result.
+        """
+        packet = self.__readPackets.get((dxlId, 'action', None))
+        if packet is None:
+            packet = self.__readPackets[(dxlId, 'action', None)] = bytes(self.makePacket(dxlId, self.INST_ACTION, []))
+        data, dxlCommResult, dxlError = self.__txRx(packet, dxlId, self.statusReturnLevel >= 2, 0)
+        return dxlCommResult
+
+    def syncWrite(self, memAddr, length, params):
+        """
+        Inputs: Start address, number of bytes per motor, and a list of (id, list of bytes).
+        Returns: The comm result (sync write gets no status packet).
+        """
+        packetLength = 8 + (length + 1) * len(params)
+        if packetLength > self.MAX_PACKET_LENGTH:
+            return COMM_TX_ERROR
+        sync = self.__sync
+        sync[0:7] = bytes([0xFF, 0xFF, self.BROADCAST_ID, packetLength - 4, self.INST_SYNC_WRITE, memAddr, length])
+        position = 7
+        for dxlId, data in params:
+            sync[position] = dxlId
+            sync[position + 1:position + 1 + length] = bytes(data)
+            position += length + 1
+        sync[position] = ~sum(self.__syncView[2:position]) & 0xFF
+        data, dxlCommResult, dxlError = self.__txRx(self.__syncView[0:packetLength], self.BROADCAST_ID, False, 0)
+        return dxlCommResult
+
+
+################# ThermalGovernor Class #####################
+#
+
+class ThermalGovernor:
+
+    def __init__(self, motors, horizon=60.0, temperatureMargin=5, timeConstant=300.0, ambient=None,
+            minScale=0.3, maxLoadRatio=0.85, voltageMargin=5, recoverDelay=5.0, maxRetries=3, printInfo=True):
+        """
+        Inputs:
+            motors: An AX_12A() instance, a MotorGroup, or the name of a group.
+            horizon: How far ahead (seconds) to predict temperature.
+            temperatureMargin: Degrees C below each motor's Temperature Limit to aim for.
+            timeConstant: Seconds for a motor to cool most of the way (about 63%) to ambient.
+            ambient: Ambient temperature in degrees C, default is each motor's first reading.
+            minScale: Speed and torque are never scaled below this fraction.
+            maxLoadRatio: Load, as a fraction of the torque limit in use, above which speed is
+                reduced to stay clear of an overload shutdown.
+            voltageMargin: Speed is reduced if the voltage gets within this much (in 0.1 V) of
+                the Min Voltage setting.
+            recoverDelay: Seconds to wait after a shutdown before turning torque back on, and how
+                long a motor has to run without an alarm before its retries are forgotten.
+            maxRetries: Give up re-enabling a motor after this many shutdowns in a row.
+        Returns: None
+        Purpose: Keep a robot running at the highest rate it can sustain instead of tripping its
+            temperature or overload alarms.  Call update() regularly, e.g. once a second.
+        """
+        if isinstance(motors, AX_12A):
+            self.motors             = [motors]
+        else:
+            self.motors             = MotorGroup.getGroup(motors).listMotors()
+        self.horizon                = horizon
+        self.temperatureMargin      = temperatureMargin
+        self.timeConstant           = timeConstant
+        self.ambient                = ambient
+        self.minScale               = minScale
+        self.maxLoadRatio           = maxLoadRatio
+        self.voltageMargin          = voltageMargin
+        self.recoverDelay           = recoverDelay
+        self.maxRetries             = maxRetries
+        self.printInfo              = printInfo
+        # Per motor ID: the model and the latest readings, see update().
+        self.status                 = {}
+        for motor in self.motors:
+            # The limits are in EEPROM, read them once and silently.
+            localPrintInfo = motor.printInfo
+            motor.printInfo = False
+            temperatureLimit = motor.getTemperatureLimit()
+            minVoltage = motor.getMinVoltage()
+            motor.printInfo = localPrintInfo
+            self.status[motor.id] = {
+                'temperatureLimit': temperatureLimit if temperatureLimit is not None else 70,
+                'minVoltage': minVoltage if minVoltage is not None else 60,
+                'ambient': ambient, 'temperature': None, 'load': None, 'voltage': None,
+                # Heating model: dT/dt = (ambient - T) / timeConstant + heatingGain * loadFraction^2
+                # heatingGain (degrees C per second at full load) is learned from the readings.
+                'heatingGain': 0.0, 'loadSquared': 0.0, 'predictedTemperature': None,
+                'modelTime': None, 'modelTemperature': None, 'loadSquaredSum': 0.0, 'loadSamples': 0,
+                'thermalScale': 1.0, 'loadScale': 1.0, 'voltageScale': 1.0,
+                'shutdown': False, 'shutdownTime': None, 'retries': 0, 'recoverTime': None, 'gaveUp': False}
+
+    def __predict(self, state):
+        # Temperature after horizon seconds if the recent load continues.
+        tau = self.timeConstant
+        steadyState = state['ambient'] + state['heatingGain'] * tau * state['loadSquared']
+        decay = exp(-self.horizon / tau)
+        return steadyState + (state['temperature'] - steadyState) * decay, decay
+
+    def __learn(self, state, t):
+        # Re-estimates heatingGain from the temperature change over at least a few seconds,
+        # temperature is only read in whole degrees.
+        if state['modelTime'] is None:
+            state['modelTime'], state['modelTemperature'] = t, state['temperature']
+            return
+        elapsed = t - state['modelTime']
+        if elapsed < 5.0 or state['loadSamples'] == 0: return
+        meanLoadSquared = state['loadSquaredSum'] / state['loadSamples']
+        if meanLoadSquared > 0.01:
+            heatingRate = (state['temperature'] - state['modelTemperature']) / elapsed
+            cooling = (state['ambient'] - state['temperature']) / self.timeConstant
+            gain = max(0.0, (heatingRate - cooling) / meanLoadSquared)
+            state['heatingGain'] = 0.7 * state['heatingGain'] + 0.3 * gain
+        state['modelTime'], state['modelTemperature'] = t, state['temperature']
+        state['loadSquaredSum'], state['loadSamples'] = 0.0, 0
+
+    def __thermalScale(self, state):
+        # How much the heating has to be cut so the predicted temperature stays under target.
+        # Heating goes with load squared, and load goes roughly with speed and torque.
+        target = state['temperatureLimit'] - self.temperatureMargin
+        predicted, decay = self.__predict(state)
+        state['predictedTemperature'] = predicted
+        if predicted <= target:
+            return min(1.0, state['thermalScale'] + 0.05)
+        if state['heatingGain'] <= 0 or state['loadSquared'] <= 0:
+            # Nothing learned yet, just back off.
+            return state['thermalScale'] * 0.9
+        allowedSteadyState = (target - state['temperature'] * decay) / (1 - decay)
+        allowedLoadSquared = (allowedSteadyState - state['ambient']) / (state['heatingGain'] * self.timeConstant)
+        if allowedLoadSquared <= 0:
+            return self.minScale
+        return min(state['thermalScale'], sqrt(allowedLoadSquared / state['loadSquared']) * state['thermalScale'])
+
+    def __recover(self, motor, state, t):
+        # Re-enable torque after an overload or overheating shutdown.  An alarm shutdown also
+        # sets Torque Limit to 0, so that is written again too.  Torque Enable is not read first:
+        # while the alarm bit is set, reads through the getters fail, and writing it is harmless.
+        if state['retries'] >= self.maxRetries:
+            if not state['gaveUp'] and self.printInfo: print("[GOVERNOR] ID:", motor.id, "Still shutting down after", state['retries'], "retries, giving up.  Call clearShutdown() once it is fixed.")
+            state['gaveUp'] = True
+            return
+        if t - state['shutdownTime'] < self.recoverDelay:
+            return
+        if state['temperature'] is not None and state['temperature'] > state['temperatureLimit'] - self.temperatureMargin:
+            return
+        localPrintInfo = motor.printInfo
+        motor.printInfo = False
+        motor.clearShadow()
+        torqueLimitError = motor.setTorqueLimit(motor.lastTorqueLimit if motor.lastTorqueLimit is not None else 1023)
+        torqueEnableError = motor.enableTorque()
+        motor.printInfo = localPrintInfo
+        state['retries'] += 1
+        # Error code 2 only means the status packet still had error bits set, the write was done.
+        if torqueLimitError in (None, 2) and torqueEnableError in (None, 2):
+            state['shutdown'] = False
+            state['recoverTime'] = t
+            if self.printInfo: print("[GOVERNOR] ID:", motor.id, "Torque re-enabled after shutdown.")
+        else:
+            # Wait the full delay again before the next try.
+            state['shutdownTime'] = t
+
+    def clearShutdown(self, motor=None):
+        """
+        Inputs: A motor (or its ID), default all motors.
+        Returns: None
+        Purpose: Forget the retries of a motor, so that after giving up (see maxRetries) torque is
+            re-enabled again by the next update() once it is safe.
+        """
+        if isinstance(motor, AX_12A): motor = motor.id
+        for id, state in self.status.items():
+            if motor is None or id == motor:
+                state['retries'], state['gaveUp'] = 0, False
+
+    def update(self):
+        """
+        Inputs: None
+        Returns: The number of motors read successfully.
+        Purpose: Read load, voltage and temperature of every motor (one round trip each), collect
+            the error bits from every status packet since the last update, update the thermal
+            model, and set speedScale and torqueScale of each motor ahead of time.  Moving Speed
+            and Torque Limit are written again when the scale changes.  After an overload or
+            overheating shutdown, torque is re-enabled once it is safe.  For motors in buffered
+            mode, the changes go out with the next flush.
+        """
+        readCount = 0
+        for motor in self.motors:
+            state = self.status[motor.id]
+            localPrintInfo = motor.printInfo
+            motor.printInfo = False
+            presentLoad, presentVoltage, presentTemperature = motor.getTelemetry()
+            motor.printInfo = localPrintInfo
+            t = perf_counter()
+            errorFlags = motor.errorFlags
+            motor.errorFlags = 0
+            if errorFlags & (motor.ERROR_OVERLOAD | motor.ERROR_OVERHEATING):
+                # The bits stay set in every status packet until torque is back on, so only
+                # the first update of a shutdown cuts the load scale.
+                if not state['shutdown']:
+                    if self.printInfo: print("[GOVERNOR] ID:", motor.id, "Alarm, error bits:", errorFlags)
+                    state['shutdown'], state['shutdownTime'] = True, t
+                    if errorFlags & motor.ERROR_OVERLOAD: state['loadScale'] *= 0.7
+                if errorFlags & motor.ERROR_OVERHEATING: state['thermalScale'] = self.minScale
+            elif state['retries'] and not state['shutdown'] and t - state['recoverTime'] >= self.recoverDelay:
+                # Running clean since the last re-enable, so the next shutdown starts counting again.
+                state['retries'] = 0
+            if presentTemperature is None: continue
+            readCount += 1
+            if state['ambient'] is None: state['ambient'] = presentTemperature
+            state['temperature'], state['load'], state['voltage'] = presentTemperature, presentLoad, presentVoltage
+            # Present Load is a fraction of full torque (1023), that is what heats the motor.
+            loadFraction = min(1.0, abs(presentLoad) / 1023)
+            state['loadSquared'] = 0.8 * state['loadSquared'] + 0.2 * loadFraction ** 2
+            state['loadSquaredSum'] += loadFraction ** 2
+            state['loadSamples'] += 1
+            # An overload happens when load gets near the Torque Limit in use (1023 if never set).
+            torqueLimit = (motor.lastTorqueLimit if motor.lastTorqueLimit is not None else 1023) * motor.torqueScale
+            loadRatio = abs(presentLoad) / max(torqueLimit, 1)
+            self.__learn(state, t)
+            state['thermalScale'] = max(self.minScale, self.__thermalScale(state))
+            if loadRatio > self.maxLoadRatio:
+                state['loadScale'] = state['loadScale'] * 0.9
+            elif not state['shutdown']:
+                # No load while torque is off, that says nothing about the overload.
+                state['loadScale'] = min(1.0, state['loadScale'] + 0.05)
+            if presentVoltage < state['minVoltage'] + self.voltageMargin:
+                state['voltageScale'] = state['voltageScale'] * 0.9
+            else:
+                state['voltageScale'] = min(1.0, state['voltageScale'] + 0.05)
+            speedScale = max(self.minScale, min(state['thermalScale'], state['loadScale'], state['voltageScale']))
+            torqueScale = state['thermalScale']
+            if state['shutdown']:
+                # The new scales are written by the next update, once torque is back on.
+                self.__recover(motor, state, t)
+                continue
+            # Only write again if the scale really changed, to keep the bus free.
+            if abs(speedScale - motor.speedScale) >= 0.02 or (speedScale == 1.0 and motor.speedScale != 1.0):
+                motor.speedScale = speedScale
+                # Never set means the default of 0, which is full speed in joint mode.
+                movingSpeed = motor.lastMovingSpeed
+                if movingSpeed is None and not motor.inWheelMode: movingSpeed = 0
+                if movingSpeed is not None:
+                    motor.printInfo = False
+                    motor.setMovingSpeed(movingSpeed)
+                    motor.printInfo = localPrintInfo
+                if self.printInfo: print("[GOVERNOR] ID:", motor.id, "Speed scale", round(speedScale, 2), "Temperature", presentTemperature, "predicted", round(state['predictedTemperature'], 1))
+            if abs(torqueScale - motor.torqueScale) >= 0.02 or (torqueScale == 1.0 and motor.torqueScale != 1.0):
+                motor.torqueScale = torqueScale
+                motor.printInfo = False
+                motor.setTorqueLimit(motor.lastTorqueLimit if motor.lastTorqueLimit is not None else 1023)
+                motor.printInfo = localPrintInfo
+        return readCount
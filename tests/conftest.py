@@ -0,0 +1,21 @@
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+try:
+    import dynamixel_sdk
+except ImportError:
+    # The tests never touch a real bus, so a module with the constants ax12a uses is enough.
+    dynamixel_sdk = types.ModuleType('dynamixel_sdk')
+    dynamixel_sdk.COMM_SUCCESS       = 0
+    dynamixel_sdk.COMM_PORT_BUSY     = -1000
+    dynamixel_sdk.COMM_TX_FAIL       = -1001
+    dynamixel_sdk.COMM_RX_FAIL       = -1002
+    dynamixel_sdk.COMM_TX_ERROR      = -2000
+    dynamixel_sdk.COMM_RX_WAITING    = -3000
+    dynamixel_sdk.COMM_RX_TIMEOUT    = -3001
+    dynamixel_sdk.COMM_RX_CORRUPT    = -3002
+    dynamixel_sdk.COMM_NOT_AVAILABLE = -9000
+    sys.modules['dynamixel_sdk'] = dynamixel_sdk
@@ -0,0 +1,25 @@
+import pytest
+
+from ax12a import AX_12A, MotorGroup
+
+def test_recreated_motor_keeps_pose_order():
+    group = MotorGroup.getGroup('testRecreate')
+    try:
+        motor1 = AX_12A(id = 1, group = group, printInfo = False)
+        motor2 = AX_12A(id = 2, group = group, printInfo = False)
+        motor3 = AX_12A(id = 3, group = group, printInfo = False)
+        # The old motor1 is still alive while the new one is created.
+        motor1 = AX_12A(id = 1, group = group, printInfo = False)
+        assert group.listMotors() == [motor1, motor2, motor3]
+        assert group.getById(1) is motor1
+    finally:
+        MotorGroup.removeGroup('testRecreate')
+
+def test_duplicate_group_name_is_rejected():
+    group = MotorGroup('testDuplicate')
+    try:
+        with pytest.raises(ValueError):
+            MotorGroup('testDuplicate')
+        assert MotorGroup.getGroup('testDuplicate') is group
+    finally:
+        MotorGroup.removeGroup('testDuplicate')
@@ -0,0 +1,90 @@
+import pytest
+
+import dynamixel_sdk
+from ax12a import Protocol1Codec
+
+class FakePort:
+    # Records what is written and hands out queued reply bytes, chunkSize at a time.
+    def __init__(self, reply=b'', chunkSize=None):
+        self.is_using = False
+        self.written = []
+        self.reply = bytearray(reply)
+        self.chunkSize = chunkSize
+
+    def clearPort(self):
+        pass
+
+    def writePort(self, packet):
+        self.written.append(bytes(packet))
+        return len(packet)
+
+    def readPort(self, length):
+        if self.chunkSize is not None: length = min(length, self.chunkSize)
+        chunk = bytes(self.reply[:length])
+        del self.reply[:length]
+        return chunk
+
+    def setPacketTimeout(self, length):
+        pass
+
+    def isPacketTimeout(self):
+        return not self.reply
+
+def statusPacket(dxlId, error, params):
+    return bytes(Protocol1Codec.makePacket(dxlId, error, params))
+
+def test_write_packet_bytes():
+    port = FakePort(statusPacket(1, 0, []))
+    codec = Protocol1Codec(port)
+    assert codec.write(1, 30, 2, 512) == (dynamixel_sdk.COMM_SUCCESS, 0)
+    assert port.written == [bytes([0xFF, 0xFF, 0x01, 0x05, 0x03, 0x1E, 0x00, 0x02, 0xD6])]
+
+def test_sync_write_length_and_checksum():
+    port = FakePort()
+    codec = Protocol1Codec(port)
+    assert codec.syncWrite(30, 4, [(1, [0, 2, 100, 0]), (2, [255, 1, 50, 0])]) == dynamixel_sdk.COMM_SUCCESS
+    packet = port.written[0]
+    assert packet[:7] == bytes([0xFF, 0xFF, 0xFE, 14, 0x83, 30, 4])
+    assert packet[3] == len(packet) - 4
+    assert packet[-1] == ~sum(packet[2:-1]) & 0xFF
+
+def test_read_resyncs_after_noise():
+    port = FakePort(b'\x00\xff\x13' + statusPacket(1, 0, [0x00, 0x02]), chunkSize=3)
+    codec = Protocol1Codec(port)
+    assert codec.read(1, 36, 2) == (512, dynamixel_sdk.COMM_SUCCESS, 0)
+    assert not port.is_using
+
+def test_read_timeout():
+    port = FakePort()
+    codec = Protocol1Codec(port)
+    value, dxlCommResult, dxlError = codec.read(1, 36, 2)
+    assert dxlCommResult == dynamixel_sdk.COMM_RX_TIMEOUT
+    assert not port.is_using
+
+def test_read_without_status_packets():
+    port = FakePort()
+    codec = Protocol1Codec(port, statusReturnLevel=0)
+    value, dxlCommResult, dxlError = codec.read(1, 36, 2)
+    assert dxlCommResult == dynamixel_sdk.COMM_NOT_AVAILABLE
+    assert port.written == []
+
+@pytest.mark.skipif(not hasattr(dynamixel_sdk, 'PacketHandler'), reason="Dynamixel SDK not installed")
+def test_packets_match_sdk():
+    sdkPort = FakePort()
+    codecPort = FakePort()
+    packetHandler = dynamixel_sdk.PacketHandler(1.0)
+    codec = Protocol1Codec(codecPort, statusReturnLevel=0)
+    for dxlId, memAddr, width, value in [(1, 30, 2, 512), (7, 24, 1, 1), (254, 32, 2, 1023)]:
+        if width == 1:
+            packetHandler.write1ByteTxOnly(sdkPort, dxlId, memAddr, value)
+        else:
+            packetHandler.write2ByteTxOnly(sdkPort, dxlId, memAddr, value)
+        codec.write(dxlId, memAddr, width, value)
+    packetHandler.writeTxOnly(sdkPort, 3, 30, 6, [0, 2, 100, 0, 255, 3])
+    codec.writeBlock(3, 30, [0, 2, 100, 0, 255, 3])
+    groupSyncWrite = dynamixel_sdk.GroupSyncWrite(sdkPort, packetHandler, 30, 2)
+    groupSyncWrite.addParam(1, [0, 2])
+    groupSyncWrite.addParam(2, [255, 1])
+    groupSyncWrite.txPacket()
+    codec.syncWrite(30, 2, [(1, [0, 2]), (2, [255, 1])])
+    assert codecPort.written == sdkPort.written